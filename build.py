@@ -2,11 +2,22 @@ import os
 import shutil
 import json
 import struct
+import argparse
+from importlib import metadata
 from pathlib import Path
-from typing import Dict, List
-from utils.fontgen import Font, FontType
+from typing import Callable, Dict, List, Optional
+from utils.fontgen import Font, FontType, GlyphPool
 import utils.fontgen as fg
+import utils.hashing as hashing
+import utils.corpus as corpus
+import utils.simulate as simulate
+from utils.coverage import CoverageIndex, bitset_codepoints, bitset_ranges, codepoints_bitset
+from utils.fontres import FontResource, format_codepoints
+from utils.sizes import SOURCES_FILE
+from utils.unicode_blocks import unicode_block
 from utils.pbpack import ResourcePack
+from utils.artifacts import ArtifactStore
+import freetype
 import logging
 
 LANG_DIR = Path('./lang/')
@@ -15,12 +26,21 @@ PBFFS_DIR = Path('./pbff/')
 BUILD_DIR = Path('./build/')
 TRANS_DIR = Path('./translation/')
 OUTPUT_FILE = 'langpack.pbl'
+COVERAGE_CACHE_FILE = 'coverage.json'
+ARTIFACT_STORE_DIR = Path('./build/artifacts/')
 USE_EXTENDED = True
 USE_LEGACY = False
 
-os.makedirs(BUILD_DIR, exist_ok=True)
+def font_source(variant_details, pbff_type) -> tuple:
+    """Returns (font type, ttf path, pbff path) of a font variant, or a None type when it is not built."""
+    if 'ttf' in variant_details:
+        return FontType.TTF, str(TTFS_DIR / variant_details['ttf']), ""
+    elif 'pbff' in variant_details and pbff_type is not None:
+        return FontType.PBFF, "", str(PBFFS_DIR / variant_details['pbff'] / f"{pbff_type}.pbff")
+    return None, "", ""
 
-def build_font_objects(json_paths, fonts_metadata, variant, vert_size, pbff_type) -> List[Font]:
+def build_font_objects(json_paths, fonts_metadata, variant, vert_size, pbff_type,
+                       codepoints_by_font: Optional[Dict[str, set]] = None) -> List[Font]:
     font_objects = []
     
     for json_path in json_paths:
@@ -32,17 +52,8 @@ def build_font_objects(json_paths, fonts_metadata, variant, vert_size, pbff_type
                 continue
             variant_details = font_metadata[variant]
 
-            ttf_path = ""
-            pbff_path = ""
-            if 'ttf' in variant_details:
-                font_type = FontType.TTF
-                ttf_path = str(TTFS_DIR / variant_details['ttf'])
-            elif 'pbff' in variant_details:
-                if pbff_type is None:
-                    continue
-                font_type = FontType.PBFF
-                pbff_path = str(PBFFS_DIR / variant_details['pbff'] / f"{pbff_type}.pbff")
-            else: 
+            font_type, ttf_path, pbff_path = font_source(variant_details, pbff_type)
+            if font_type is None:
                 continue
 
             if ttf_path == "" and pbff_path == "":
@@ -63,7 +74,10 @@ def build_font_objects(json_paths, fonts_metadata, variant, vert_size, pbff_type
 
             max_glyphs = 32640 if USE_EXTENDED else 256
             font_obj = Font(font_type, ttf_path, pbff_path, font_height, max_glyphs, USE_LEGACY)
-            font_obj.set_codepoint_list(json_path)
+            if codepoints_by_font is None:
+                font_obj.set_codepoint_list(json_path)
+            else:  # fallback chains resolved for this variant
+                font_obj.codepoints = codepoints_by_font.get(font_name, set())
             font_obj.set_heightoffset(font_offset)
             if font_type == FontType.TTF:
                 font_obj.set_fauxbold(variant_details.get('bold', False))
@@ -73,7 +87,11 @@ def build_font_objects(json_paths, fonts_metadata, variant, vert_size, pbff_type
     return font_objects
 
 # Function to merge multiple Fonts
-def merge_fonts(fonts: List[Font]) -> Font:
+def merge_fonts(fonts: List[Font], glyph_pool: Optional[GlyphPool] = None,
+                choose_table_size: Optional[Callable[[List[int]], int]] = None,
+                glyph_rank: Optional[Dict[int, int]] = None,
+                trim_glyphs: bool = False,
+                jobs: int = 1) -> Font:
         def build_hash_table(m:Font, bucket_sizes):
             acc = 0
             for i in range(m.table_size):
@@ -96,10 +114,11 @@ def merge_fonts(fonts: List[Font]) -> Font:
         def add_glyph(m:Font, f:Font, codepoint, next_offset, gindex, glyph_indices_lookup):
             offset = next_offset
             if (id(f), gindex) not in glyph_indices_lookup:
-                if f.type == FontType.TTF:
-                    glyph_bits = f.glyph_bits_ttf(gindex)
-                else:  # assuming PBFF
-                    glyph_bits = f.glyph_bits_pbff(codepoint)
+                glyph_bits = glyph_pool.glyph_bits(f, codepoint, gindex)
+                if trim_glyphs:
+                    trimmed_bits = fg.trim_glyph(glyph_bits)
+                    m.trimmed_bytes += len(glyph_bits) - len(trimmed_bits)
+                    glyph_bits = trimmed_bits
                 glyph_indices_lookup[(id(f), gindex)] = offset
                 m.glyph_table.append(glyph_bits)
                 next_offset += len(glyph_bits)
@@ -123,6 +142,8 @@ def merge_fonts(fonts: List[Font]) -> Font:
         
         if not fonts:
             raise ValueError("No fonts to merge")
+        if glyph_pool is None:
+            glyph_pool = GlyphPool()
         
         # Validate all fonts share same settings
         ref_height = fonts[0].max_height
@@ -146,10 +167,13 @@ def merge_fonts(fonts: List[Font]) -> Font:
         glyph_entries.append((fg.WILDCARD_CODEPOINT, offset))
         next_offset = 4 + len(merged.glyph_table[-1])
 
-        for thisfont in fonts:
-            codepoint, gindex = thisfont.get_first_char()
+        if jobs > 1:
+            # render in worker processes first; the loop below then takes the glyphs from the pool in order
+            glyph_pool.prerender([(f, [(codepoint, gindex) for codepoint, gindex in glyph_pool.chars(f)
+                                       if codepoint_is_in_subset(f, codepoint)]) for f in fonts], jobs)
 
-            while gindex:
+        for thisfont in fonts:
+            for codepoint, gindex in glyph_pool.chars(thisfont):
                 if merged.number_of_glyphs > merged.max_glyphs:
                     break
 
@@ -165,104 +189,19 @@ def merge_fonts(fonts: List[Font]) -> Font:
                     offset, next_offset, glyph_indices_lookup = add_glyph(merged, thisfont, codepoint, next_offset, gindex, glyph_indices_lookup)
                     glyph_entries.append((codepoint, offset))
 
-                codepoint, gindex = thisfont.get_next_char(codepoint, gindex)
-
         sorted_entries = sorted(glyph_entries, key=lambda entry: entry[0])
+        if choose_table_size is not None:
+            merged.set_table_size(choose_table_size([entry[0] for entry in sorted_entries]))
+        if glyph_rank is not None:
+            # Buckets are scanned linearly on the watch, so put the most used glyphs first
+            unranked = len(glyph_rank)
+            sorted_entries.sort(key=lambda entry: glyph_rank.get(entry[0], unranked))
         hash_bucket_sizes = build_offset_tables(merged, sorted_entries)
         build_hash_table(merged, hash_bucket_sizes)
         return merged
 
-glyph_map_font: Dict[int, str] = {}
-
-# Build codepoint -> font map
-
-print("Building codepoint list")
-
-# Read all *.txt files in './lang/'
-for filename in os.listdir(LANG_DIR):
-    if filename.endswith('.txt'):
-        with open(LANG_DIR/filename, 'r', encoding='utf-8') as f:
-            font_name = None
-            for line in f:
-                line = line.strip()
-                if line.startswith('#') or line == '':
-                    if line.startswith('#font:'):
-                        font_name = line.split(':', 1)[1].strip()
-                    continue
-                if font_name is None:
-                    raise Exception('Font file not specified in ' + filename)
-                for ch in line:
-                    if font_name:
-                        glyph_map_font[ord(ch)] = font_name
-
-# Read './lang/unicodes.json'
-unicodes_path = LANG_DIR/'unicodes.json'
-with open(unicodes_path, 'r', encoding='utf-8') as f:
-    unicode_specs = json.load(f)
-
-for spec in unicode_specs:
-    start_cp = int(spec['start'], 16)
-    end_cp = int(spec['end'], 16)
-    font_name = spec.get('font')
-    if font_name is None:
-        raise KeyError(f'unicode spec with name {spec.get("name")} must have "font" specified')
-
-    for cp in range(start_cp, end_cp + 1):
-        if font_name:
-            glyph_map_font[cp] = font_name
-
-glyph_inv_font: Dict[str, List[int]] = {}
-
-# Build the inverse mappings
-for key, value in glyph_map_font.items():
-    if value not in glyph_inv_font:
-        glyph_inv_font[value] = []
-    glyph_inv_font[value].append(key)
-
-json_paths = []
-
-# Build font -> codepoint map
-for font_name in glyph_inv_font:
-    codepoints = glyph_inv_font[font_name]
-    # Sort codepoints for consistent output
-    sorted_codepoints = sorted(list(codepoints))
-
-    # Convert codepoints to characters
-    characters = []
-    for codepoint in sorted_codepoints:
-        char = chr(codepoint)
-        characters.append(char)
-
-    output_data = {
-        "font": font_name,
-        "count": len(sorted_codepoints),
-        "chars": ''.join(characters),
-        "codepoints": sorted_codepoints
-    }
-
-    output_path = BUILD_DIR / f"{font_name}.json"
-
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
-    json_paths.append(output_path)
-    print(f"Saved: {output_path}")
-
-if len(json_paths) < 1:
-    raise Exception("No JSON files found. Exiting.")
-
-# Read './lang/fonts.json'
-fonts_path = LANG_DIR / 'fonts.json'
-fonts_metadata = {}
-with open(fonts_path, 'r', encoding='utf-8') as f:
-    fonts_specs = json.load(f)
-    fonts_metadata = dict([(font_spec['name'], font_spec['variants']) for font_spec in fonts_specs])
-
-# Build the character set
-
-print("Building resource")
-
+# pebble font resource key: (required font height + offset(vertical size), pbff file name)
 builds = {
-    # pebble font resource key: (required font height + offset(vertical size), pbff file name)
     '001': (14, '14'),
     '002': (14, '14_bold'),
     '003': (18, '18'),
@@ -285,50 +224,479 @@ builds = {
     '020': (28, None),
 }
 
-for key, values in builds.items():
-    fonts = build_font_objects(
-        json_paths=json_paths,
-        fonts_metadata=fonts_metadata,
-        variant=key,
-        vert_size=values[0],
-        pbff_type=values[1]
-    )
-    if not fonts:
-        with open(BUILD_DIR / key, 'wb') as f:
-            pass
-        continue
-        
-    merged_font = merge_fonts(fonts)
-    if merged_font is None:
-        raise Exception("Failed to merge fonts. Exiting.")
-    
-    with open(BUILD_DIR / key, 'wb') as f:
-        f.write(merged_font.bitstring())
 
-for file_name in [str(i).zfill(3) for i in range(1, 21)]:
-    output_path = BUILD_DIR / file_name
-    if not output_path.exists():
-        with open(output_path, 'wb') as f:
-            pass
+# Build codepoint -> font map
+def font_chain(font_spec) -> tuple:
+    """Parses a font or fallback list, e.g. "Thai, GoNotoKurrent" or ["Thai", "GoNotoKurrent"]."""
+    if isinstance(font_spec, str):
+        font_spec = font_spec.split(',')
+    return tuple(name.strip() for name in font_spec if name.strip())
+
+
+def read_glyph_map(lang_dir: Path, txt_files: Optional[List[str]] = None, unicode_names: Optional[List[str]] = None) -> Dict[int, tuple]:
+    """
+    Reads the character lists in lang_dir into codepoint -> fonts to try, in
+    order. txt_files restricts which *.txt files are read and unicode_names
+    which ranges of unicodes.json are used; None means all of them.
+    """
+    glyph_map_font: Dict[int, tuple] = {}
+
+    # Read all *.txt files in './lang/', in name order so the build does not depend on the file system
+    for filename in sorted(os.listdir(lang_dir)):
+        if filename.endswith('.txt'):
+            if txt_files is not None and filename not in txt_files:
+                continue
+            with open(lang_dir/filename, 'r', encoding='utf-8') as f:
+                font_name = None
+                for line in f:
+                    line = line.strip()
+                    if line.startswith('#') or line == '':
+                        if line.startswith('#font:'):
+                            font_name = font_chain(line.split(':', 1)[1])
+                        continue
+                    if font_name is None:
+                        raise Exception('Font file not specified in ' + filename)
+                    for ch in line:
+                        if font_name:
+                            glyph_map_font[ord(ch)] = font_name
+
+    # Read './lang/unicodes.json'
+    unicodes_path = lang_dir/'unicodes.json'
+    with open(unicodes_path, 'r', encoding='utf-8') as f:
+        unicode_specs = json.load(f)
+
+    for spec in unicode_specs:
+        if unicode_names is not None and spec.get('name') not in unicode_names:
+            continue
+        start_cp = int(spec['start'], 16)
+        end_cp = int(spec['end'], 16)
+        if spec.get('font') is None:
+            raise KeyError(f'unicode spec with name {spec.get("name")} must have "font" specified')
+        font_name = font_chain(spec['font'])
+
+        for cp in range(start_cp, end_cp + 1):
+            if font_name:
+                glyph_map_font[cp] = font_name
+
+    return glyph_map_font
+
+
+# Build font -> codepoint map
+def write_codepoint_lists(glyph_map_font: Dict[int, tuple], build_dir: Path) -> List[Path]:
+    glyph_inv_font: Dict[str, List[int]] = {}
+
+    # Build the inverse mappings; a font lists every codepoint it may be used for
+    for key, chain in glyph_map_font.items():
+        for value in chain:
+            if value not in glyph_inv_font:
+                glyph_inv_font[value] = []
+            glyph_inv_font[value].append(key)
+
+    json_paths = []
+
+    for font_name in glyph_inv_font:
+        codepoints = glyph_inv_font[font_name]
+        # Sort codepoints for consistent output
+        sorted_codepoints = sorted(list(codepoints))
+
+        # Convert codepoints to characters
+        characters = []
+        for codepoint in sorted_codepoints:
+            char = chr(codepoint)
+            characters.append(char)
+
+        output_data = {
+            "font": font_name,
+            "count": len(sorted_codepoints),
+            "chars": ''.join(characters),
+            "codepoints": sorted_codepoints
+        }
+
+        output_path = build_dir / f"{font_name}.json"
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        json_paths.append(output_path)
+        print(f"Saved: {output_path}")
+
+    if len(json_paths) < 1:
+        raise Exception("No JSON files found. Exiting.")
+
+    return json_paths
 
-shutil.copy(TRANS_DIR / '000', BUILD_DIR / '000')
 
-print("Packing resources")
+# Read './lang/fonts.json'
+def read_fonts_metadata(lang_dir: Path) -> dict:
+    fonts_path = lang_dir / 'fonts.json'
+    with open(fonts_path, 'r', encoding='utf-8') as f:
+        fonts_specs = json.load(f)
+        return dict([(font_spec['name'], font_spec['variants']) for font_spec in fonts_specs])
+
+
+def chain_bitsets(glyph_map_font: Dict[int, tuple]) -> Dict[tuple, int]:
+    """Returns font chain -> bitset of the codepoints requested from it."""
+    requested: Dict[tuple, List[int]] = {}
+    for cp, chain in glyph_map_font.items():
+        requested.setdefault(chain, []).append(cp)
+    return dict((chain, codepoints_bitset(cps)) for chain, cps in requested.items())
+
+
+def resolve_fonts(requested_bits: Dict[tuple, int], fonts_metadata, variant, pbff_type, coverage_index: CoverageIndex) -> tuple:
+    """
+    Assigns every codepoint to the first font of its chain whose file for this
+    variant has a glyph for it. Returns font name -> bitset of assigned
+    codepoints, and chain -> bitset of codepoints none of its fonts cover.
+    """
+    assigned: Dict[str, int] = {}
+    missing: Dict[tuple, int] = {}
+    for chain, bits in requested_bits.items():
+        remaining = bits
+        has_variant = False
+        for font_name in chain:
+            variant_details = fonts_metadata[font_name].get(variant)
+            if variant_details is None:
+                continue
+            font_type, ttf_path, pbff_path = font_source(variant_details, pbff_type)
+            if font_type is None:
+                continue
+            has_variant = True
+            covered = remaining & coverage_index.coverage(ttf_path or pbff_path)
+            assigned[font_name] = assigned.get(font_name, 0) | covered
+            remaining &= ~covered
+        if has_variant and remaining:
+            missing[chain] = remaining
+    return assigned, missing
+
+
+def find_missing_glyphs(glyph_map_font: Dict[int, tuple], fonts_metadata, coverage_index: CoverageIndex) -> Dict[tuple, List[int]]:
+    """
+    Returns (font chain, variant) -> requested codepoints that no font file of
+    the chain has a glyph for in that variant, using the coverage index only.
+    """
+    requested_bits = chain_bitsets(glyph_map_font)
+    missing = {}
+    for key, values in builds.items():
+        _, variant_missing = resolve_fonts(requested_bits, fonts_metadata, key, values[1], coverage_index)
+        for chain, bits in variant_missing.items():
+            missing[(chain, key)] = bitset_codepoints(bits)
+    return missing
+
+
+def print_missing_glyphs(missing: Dict[tuple, List[int]]):
+    if not missing:
+        print("Every requested character is covered by its font")
+        return
+    # Variants of a font usually miss the same characters, so list them together
+    variants_by_missing: Dict[tuple, List[str]] = {}
+    for (chain, key), codepoints in missing.items():
+        variants_by_missing.setdefault((' > '.join(chain), tuple(codepoints)), []).append(key)
+    print("Missing glyphs (they will be left out of the pack):")
+    for (font_name, codepoints), keys in variants_by_missing.items():
+        by_block: Dict[str, List[int]] = {}
+        for cp in codepoints:
+            by_block.setdefault(unicode_block(cp), []).append(cp)
+        for block, block_codepoints in by_block.items():
+            print(f"  {', '.join(keys)} {font_name}, {block}: {len(block_codepoints)} "
+                  f"({format_codepoints(block_codepoints, max_ranges=8)})")
+
+
+def variant_spec(fonts: List[Font]) -> tuple:
+    """Everything a merged font is built from; variants with equal specs produce identical resources."""
+    return tuple((f.render_key(),
+                  frozenset(f.codepoints),
+                  f.regex.pattern if f.regex is not None else None,
+                  f.max_glyphs) for f in fonts)
+
+
+def build_resources(json_paths, glyph_map_font: Dict[int, tuple], fonts_metadata, coverage_index: CoverageIndex,
+                    build_dir: Path, args, glyph_pool: Optional[GlyphPool] = None):
+    requested_bits = chain_bitsets(glyph_map_font)
+    glyph_rank = corpus.read_ranking(args.rank) if args.rank else None
+    reference_counts = corpus.read_text_counts(args.reference_text) if args.reference_text else None
+    if glyph_pool is None:
+        glyph_pool = GlyphPool()
+    # variant spec -> (resource key, resource) of the variants built so far
+    built: Dict[tuple, tuple] = {}
+    # variant -> font name -> codepoint ranges taken from it, for utils.sizes
+    sources: Dict[str, dict] = {}
+
+    for key, values in builds.items():
+        assigned, _ = resolve_fonts(requested_bits, fonts_metadata, key, values[1], coverage_index)
+        fonts = build_font_objects(
+            json_paths=json_paths,
+            fonts_metadata=fonts_metadata,
+            variant=key,
+            vert_size=values[0],
+            pbff_type=values[1],
+            codepoints_by_font=dict((font_name, set(bitset_codepoints(bits))) for font_name, bits in assigned.items())
+        )
+        if not fonts:
+            with open(build_dir / key, 'wb') as f:
+                pass
+            continue
+        sources[key] = dict((font_name, bitset_ranges(bits)) for font_name, bits in assigned.items() if bits)
+
+        spec = variant_spec(fonts)
+        if spec in built:
+            same_key, content = built[spec]
+            print(f"{key}: same fonts and settings as {same_key}, reusing it")
+            with open(build_dir / key, 'wb') as f:
+                f.write(content)
+            continue
+
+        choose_table_size = None
+        if args.optimize_hash_table:
+            def choose_table_size(codepoints, key=key):
+                # with a fixed timestamp the build must not depend on machine speed, so every size is tried
+                time_budget = args.hash_table_time_budget if args.timestamp is None else None
+                choice = hashing.optimize_table_size(codepoints, args.hash_table_max_size, time_budget)
+                print(f"{key}: {choice}")
+                return choice.table_size
+
+        merged_font = merge_fonts(fonts, glyph_pool, choose_table_size, glyph_rank, args.trim_glyphs, args.jobs)
+        if merged_font is None:
+            raise Exception("Failed to merge fonts. Exiting.")
+
+        if args.trim_glyphs:
+            glyph_table_size = sum(len(glyph) for glyph in merged_font.glyph_table)
+            print(f"{key}: trimmed blank glyph rows and columns, saved {merged_font.trimmed_bytes} of "
+                  f"{glyph_table_size + merged_font.trimmed_bytes} glyph bytes")
+
+        content = merged_font.bitstring()
+        if reference_counts is not None:
+            font_resource = FontResource(content)
+            before = simulate.replay(simulate.codepoint_order(font_resource), reference_counts)
+            after = simulate.replay(font_resource, reference_counts)
+            print(f"{key}: comparisons per character of {args.reference_text}: {before.comparisons_per_character:.2f} "
+                  f"in codepoint order, {after.comparisons_per_character:.2f} as built")
+        built[spec] = (key, content)
+        with open(build_dir / key, 'wb') as f:
+            f.write(content)
+
+    for file_name in [str(i).zfill(3) for i in range(1, 21)]:
+        output_path = build_dir / file_name
+        if not output_path.exists():
+            with open(output_path, 'wb') as f:
+                pass
+
+    shutil.copy(TRANS_DIR / '000', build_dir / '000')
+    with open(build_dir / SOURCES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(sources, f)
+
+
+def print_stored(output_path: Path, args):
+    print("Completed from the artifact store. Output: " + str(output_path))
+    if args.optimize_hash_table:
+        print("  hash table sizes were chosen when the pack was stored; use --no-artifact-store to see the report")
+
+
+def stored_files(output_path: Path, build_dir: Path) -> Dict[str, Path]:
+    """The files the artifact store keeps for a pack."""
+    return {'pack': output_path, SOURCES_FILE: build_dir / SOURCES_FILE}
+
 
 # Pack all files
-pack = ResourcePack()
-for f in [str(i).zfill(3) for i in range(0, 21)]:
-    with open(BUILD_DIR / f, 'rb') as resource_file:
-        content = resource_file.read()
-    if f == '020' and len(content) != 0 and content in pack.contents:   # workaround; last resource must not be duplicate
-        pack.contents.append(content)
-        pack.table.append(len(pack.contents) - 1)
-    else:
-        pack.add_resource(content)
-with open(BUILD_DIR / OUTPUT_FILE, 'wb') as pack_file:
-    pack.serialize(pack_file)
+def pack_resources(build_dir: Path, output_path: Path, timestamp: Optional[int] = None):
+    pack = ResourcePack(timestamp)
+    for f in [str(i).zfill(3) for i in range(0, 21)]:
+        with open(build_dir / f, 'rb') as resource_file:
+            content = resource_file.read()
+        if f == '020' and len(content) != 0 and content in pack.contents:   # workaround; last resource must not be duplicate
+            pack.contents.append(content)
+            pack.table.append(len(pack.contents) - 1)
+        else:
+            pack.add_resource(content)
+    with open(output_path, 'wb') as pack_file:
+        pack.serialize(pack_file)
+
+
+def unpack_resources(pack_path: Path, build_dir: Path):
+    """Writes the resources of a pack back to build_dir as 000 to 020."""
+    with open(pack_path, 'rb') as pack_file:
+        pack = ResourcePack.deserialize(pack_file)
+    for index, content in enumerate(pack.contents):
+        with open(build_dir / str(index).zfill(3), 'wb') as f:
+            f.write(content)
+
+
+def build_config(args, pack_spec: Optional[dict] = None) -> dict:
+    """The options that affect the content of a pack, for the artifact store key."""
+    return {
+        # the rendered glyph bits depend on the FreeType library and its bindings
+        'freetype': '.'.join(str(part) for part in freetype.version()),
+        'freetype_py': metadata.version('freetype-py'),
+        'extended': USE_EXTENDED,
+        'legacy': USE_LEGACY,
+        'timestamp': args.timestamp,
+        'optimize_hash_table': args.optimize_hash_table,
+        'hash_table_max_size': args.hash_table_max_size if args.optimize_hash_table else None,
+        'trim_glyphs': args.trim_glyphs,
+        'rank': [path.as_posix() for path in args.rank or []],
+        'lang': pack_spec.get('lang') if pack_spec else None,
+        'unicodes': pack_spec.get('unicodes') if pack_spec else None,
+    }
+
 
-print("Completed. Output: " + str(BUILD_DIR / OUTPUT_FILE))
+def build_inputs(fonts_metadata, args) -> List[Path]:
+    """Every file a build reads: lang/, the translation, the fonts, the rankings and the build scripts."""
+    paths = [path for path in LANG_DIR.iterdir() if path.is_file()]
+    paths.append(TRANS_DIR / '000')
+    for variants in fonts_metadata.values():
+        for variant, variant_details in variants.items():
+            if variant in builds:
+                font_type, ttf_path, pbff_path = font_source(variant_details, builds[variant][1])
+                if font_type is not None:
+                    paths.append(Path(ttf_path or pbff_path))
+    paths.extend(args.rank or [])
+    code_dir = Path(__file__).parent
+    paths.append(code_dir / 'build.py')
+    paths.extend((code_dir / 'utils').glob('*.py'))
+    return sorted(set(paths))
+
+
+def artifact_store(args) -> Optional[ArtifactStore]:
+    if not args.artifact_store:
+        return None
+    if args.reference_text:
+        # a stored pack would skip the comparisons --reference-text asks for
+        print("Not using the artifact store: --reference-text needs the variants to be built")
+        return None
+    if args.timestamp is None:
+        # without a fixed timestamp a stored pack would not be what this build produces
+        print("Not using the artifact store: set SOURCE_DATE_EPOCH or --timestamp to make the build reproducible")
+        return None
+    return ArtifactStore(ARTIFACT_STORE_DIR, args.artifact_store_max_size * 1024 * 1024)
+
+
+def build(args):
+    os.makedirs(BUILD_DIR, exist_ok=True)
+
+    print("Building codepoint list")
+    glyph_map_font = read_glyph_map(LANG_DIR)
+    fonts_metadata = read_fonts_metadata(LANG_DIR)
+
+    coverage_index = CoverageIndex(BUILD_DIR / COVERAGE_CACHE_FILE)
+    print_missing_glyphs(find_missing_glyphs(glyph_map_font, fonts_metadata, coverage_index))
+    coverage_index.save()
+    if args.preflight:
+        return
+
+    store = artifact_store(args)
+    if store is not None:
+        artifact_key = store.key(build_config(args), build_inputs(fonts_metadata, args))
+        if store.get(artifact_key, stored_files(BUILD_DIR / OUTPUT_FILE, BUILD_DIR)):
+            unpack_resources(BUILD_DIR / OUTPUT_FILE, BUILD_DIR)
+            print_stored(BUILD_DIR / OUTPUT_FILE, args)
+            return
+
+    json_paths = write_codepoint_lists(glyph_map_font, BUILD_DIR)
+
+    print("Building resource")
+    build_resources(json_paths, glyph_map_font, fonts_metadata, coverage_index, BUILD_DIR, args)
+
+    print("Packing resources")
+    pack_resources(BUILD_DIR, BUILD_DIR / OUTPUT_FILE, args.timestamp)
+    if store is not None:
+        store.put(artifact_key, stored_files(BUILD_DIR / OUTPUT_FILE, BUILD_DIR))
+
+    print("Completed. Output: " + str(BUILD_DIR / OUTPUT_FILE))
+
+
+def build_batch(manifest_path: Path, args):
+    """
+    Builds every pack listed in the manifest, e.g.
+
+        {"packs": [{"name": "EN_JP", "lang": ["kanji.txt"], "unicodes": ["JP Sym", "JP Kana"]}]}
+
+    "lang" and "unicodes" select the lang/*.txt files and the unicodes.json
+    ranges (by name) to include; leave them out to include all of them. All
+    packs share one glyph pool, so a glyph needed by several packs is only
+    rendered once per font variant.
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    pack_specs = manifest['packs']
+    names = [spec['name'] for spec in pack_specs]
+    if len(set(names)) != len(names):
+        raise KeyError('Pack names in the batch manifest must be unique')
+
+    fonts_metadata = read_fonts_metadata(LANG_DIR)
+    glyph_pool = GlyphPool()
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    coverage_index = CoverageIndex(BUILD_DIR / COVERAGE_CACHE_FILE)
+    store = None if args.preflight else artifact_store(args)
+    stored = 0
+
+    for spec in pack_specs:
+        pack_dir = BUILD_DIR / spec['name']
+        os.makedirs(pack_dir, exist_ok=True)
+        output_path = pack_dir / spec.get('output', f"{spec['name']}.pbl")
+
+        print(f"Building pack {spec['name']}")
+        glyph_map_font = read_glyph_map(LANG_DIR, spec.get('lang'), spec.get('unicodes'))
+        print_missing_glyphs(find_missing_glyphs(glyph_map_font, fonts_metadata, coverage_index))
+        coverage_index.save()
+        if args.preflight:
+            continue
+
+        if store is not None:
+            artifact_key = store.key(build_config(args, spec), build_inputs(fonts_metadata, args))
+            if store.get(artifact_key, stored_files(output_path, pack_dir)):
+                unpack_resources(output_path, pack_dir)
+                stored += 1
+                print_stored(output_path, args)
+                continue
+
+        json_paths = write_codepoint_lists(glyph_map_font, pack_dir)
+        build_resources(json_paths, glyph_map_font, fonts_metadata, coverage_index, pack_dir, args, glyph_pool)
+        pack_resources(pack_dir, output_path, args.timestamp)
+        if store is not None:
+            store.put(artifact_key, stored_files(output_path, pack_dir))
+        print("Completed. Output: " + str(output_path))
+
+    print(f"Rendered {glyph_pool.rendered} distinct glyphs for {len(pack_specs) - stored} packs, {glyph_pool.reused} reused")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a Pebble language pack from lang/, ttf/ and pbff/.')
+    parser.add_argument('--batch', type=Path, metavar='MANIFEST',
+                        help='build every pack listed in a JSON manifest, sharing rendered glyphs between them')
+    parser.add_argument('--preflight', action='store_true',
+                        help='only report the requested characters that the configured fonts have no glyph for')
+    parser.add_argument('--optimize-hash-table', action='store_true',
+                        help=f'pick the glyph hash table size with the shortest buckets per variant instead of {fg.HASH_TABLE_SIZE}')
+    parser.add_argument('--hash-table-max-size', type=int, default=hashing.MAX_TABLE_SIZE,
+                        help='largest hash table size to try (4 bytes per entry)')
+    parser.add_argument('--hash-table-time-budget', type=float, default=2.0,
+                        help='seconds to spend searching the hash table size per variant')
+    parser.add_argument('--no-trim-glyphs', dest='trim_glyphs', action='store_false',
+                        help='keep the blank rows and columns around glyph bitmaps')
+    parser.add_argument('--rank', type=Path, action='append',
+                        help='order each hash bucket by this frequency ranking: a lang/*.txt style list or a '
+                             'codepoint<TAB>count .tsv file; repeat to append further rankings')
+    parser.add_argument('--reference-text', type=Path,
+                        help='print the expected comparisons per character of this text for each variant')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='render the glyphs of each variant in this many worker processes')
+    parser.add_argument('--timestamp', type=int,
+                        help='seconds since the epoch to stamp into the pack instead of the current time, '
+                             'making the build reproducible; defaults to SOURCE_DATE_EPOCH when it is set')
+    parser.add_argument('--no-artifact-store', dest='artifact_store', action='store_false',
+                        help=f'always build, without looking up or storing the pack in {ARTIFACT_STORE_DIR}')
+    parser.add_argument('--artifact-store-max-size', type=int, default=256, metavar='MB',
+                        help='evict the least recently used packs once the artifact store grows past this size')
+    args = parser.parse_args()
+    if args.timestamp is None and os.environ.get('SOURCE_DATE_EPOCH'):
+        try:
+            args.timestamp = int(os.environ['SOURCE_DATE_EPOCH'])
+        except ValueError:
+            parser.error(f"SOURCE_DATE_EPOCH must be seconds since the epoch, not {os.environ['SOURCE_DATE_EPOCH']!r}")
+
+    if args.batch:
+        build_batch(args.batch, args)
+    else:
+        build(args)
 
 # NOTE
 # 001	GOTHIC_14_EXTENDED
@@ -0,0 +1,98 @@
+"""
+Content-addressed store of finished language packs and their build records.
+
+A pack is stored under the SHA-256 of its normalized build config and the
+contents of every file the build reads, so building the same pack again is a
+file copy. Each stored artifact is a directory of named files. Once the
+store grows past its size limit the least recently used packs are evicted.
+Input file digests are cached by size and modification time, like the
+coverage index, so large fonts are only hashed when they change.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+INDEX_FILE = 'index.json'
+
+
+class ArtifactStore:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.files: Dict[str, dict] = {}
+        self.artifacts: Dict[str, dict] = {}
+        os.makedirs(root, exist_ok=True)
+        index_path = root / INDEX_FILE
+        if index_path.exists():
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.files = index['files']
+            self.artifacts = index['artifacts']
+
+    def file_digest(self, path: Path) -> Optional[str]:
+        """Returns the SHA-256 of the file's content, or None when it does not exist."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        entry = self.files.get(str(path))
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+            self.files[str(path)] = entry
+        return entry['sha256']
+
+    def key(self, config: dict, input_paths: Iterable[Path]) -> str:
+        """Hashes the config, as canonical JSON, together with the name and content of every input file."""
+        inputs = dict((Path(path).as_posix(), self.file_digest(Path(path))) for path in input_paths)
+        normalized = json.dumps({'config': config, 'inputs': inputs}, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def get(self, key: str, files: Dict[str, Path]) -> bool:
+        """Copies the stored files (name -> destination) and returns whether they were all stored."""
+        if key not in self.artifacts or not all((self.path(key) / name).exists() for name in files):
+            return False
+        for name, output_path in files.items():
+            shutil.copyfile(self.path(key) / name, output_path)
+        self.artifacts[key]['used'] = time.time()
+        self.save()
+        return True
+
+    def put(self, key: str, files: Dict[str, Path]):
+        """Stores the files (name -> path) under the key."""
+        temp_dir = self.root / f"{key}.tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        for name, path in files.items():
+            shutil.copyfile(path, temp_dir / name)
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        os.replace(temp_dir, self.path(key))
+        self.artifacts[key] = {'size': sum(os.path.getsize(path) for path in files.values()), 'used': time.time()}
+        self.evict()
+        self.save()
+
+    def evict(self):
+        """Removes the least recently used packs until the store fits in max_bytes."""
+        total = sum(artifact['size'] for artifact in self.artifacts.values())
+        for key in sorted(self.artifacts, key=lambda k: self.artifacts[k]['used']):
+            if total <= self.max_bytes:
+                break
+            total -= self.artifacts.pop(key)['size']
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    def save(self):
+        temp_path = self.root / f"{INDEX_FILE}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'artifacts': self.artifacts}, f)
+        os.replace(temp_path, self.root / INDEX_FILE)
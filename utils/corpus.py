@@ -0,0 +1,229 @@
+"""
+Builds frequency-ranked character lists (lang/*.txt) from large text corpora.
+
+Corpus files are split into fixed-size byte chunks that are counted in a
+process pool, so memory stays bounded by the chunk size and the number of
+distinct characters rather than by the size of the corpus. The corpus must be
+UTF-8 encoded.
+
+    python -m utils.corpus --font GoNotoKurrent --include '[\\u4e00-\\u9fff]' \\
+        --coverage 0.99 -o lang/kanji_corpus.txt corpus/
+"""
+
+import argparse
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MAX_CODEPOINT = 0x10ffff
+CHUNK_SIZE = 16 * 1024 * 1024
+MAX_UTF8_SEQUENCE_BYTES = 4
+
+
+def corpus_files(paths: List[Path]) -> Iterator[Path]:
+    for path in paths:
+        if path.is_dir():
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    yield Path(root) / name
+        else:
+            yield path
+
+
+def chunk_ranges(paths: List[Path], chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, int, int]]:
+    for path in corpus_files(paths):
+        size = path.stat().st_size
+        for start in range(0, size, chunk_size):
+            yield str(path), start, min(start + chunk_size, size)
+
+
+def count_chunk(task: Tuple[str, int, int]) -> Counter:
+    """
+    Counts the characters whose first byte lies in [start, end) of the file.
+    Continuation bytes at the start belong to the previous chunk and a
+    sequence cut by the end is completed from the following bytes.
+    """
+    path, start, end = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start + MAX_UTF8_SEQUENCE_BYTES - 1)
+    begin = 0
+    if start > 0:
+        while begin < len(data) and data[begin] & 0xC0 == 0x80:
+            begin += 1
+    stop = end - start
+    while stop < len(data) and data[stop] & 0xC0 == 0x80:
+        stop += 1
+    return Counter(data[begin:stop].decode('utf-8', errors='ignore'))
+
+
+def count_codepoints(paths: List[Path], jobs: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> array:
+    """Returns an array indexed by codepoint holding the number of occurrences."""
+    counts = array('Q', bytes(8 * (MAX_CODEPOINT + 1)))
+    with Pool(jobs) as pool:
+        for chunk_counts in pool.imap_unordered(count_chunk, chunk_ranges(paths, chunk_size)):
+            for ch, count in chunk_counts.items():
+                counts[ord(ch)] += count
+    return counts
+
+
+def is_listable(codepoint: int) -> bool:
+    """Whether the character can be written as a line of a lang/*.txt file."""
+    ch = chr(codepoint)
+    if ch == '#' or ch.isspace() or ch == '\ufeff':  # '#' would start a comment line
+        return False
+    return not unicodedata.category(ch).startswith('C')
+
+
+def matching_codepoints(counts: array, include: Optional[str] = None) -> List[Tuple[int, int]]:
+    """Returns (codepoint, count) of the listable characters seen that match the `include` regex."""
+    regex = re.compile(include) if include else None
+    return [(cp, count) for cp, count in enumerate(counts)
+            if count and is_listable(cp) and (regex is None or regex.match(chr(cp)))]
+
+
+def rank_codepoints(counts: array,
+                    include: Optional[str] = None,
+                    top: Optional[int] = None,
+                    coverage: Optional[float] = None,
+                    min_count: int = 1) -> List[Tuple[int, int]]:
+    """
+    Returns (codepoint, count) pairs by descending count, cut off after `top`
+    entries or once the entries cover `coverage` of the matching characters
+    (see matching_codepoints), counting characters below `min_count` too.
+    """
+    matching = matching_codepoints(counts, include)
+    ranked = [(cp, count) for cp, count in matching if count >= min_count]
+    ranked.sort(key=lambda entry: (-entry[1], entry[0]))
+
+    if coverage is not None:
+        total = sum(count for _, count in matching)
+        covered = 0
+        for i, (_, count) in enumerate(ranked):
+            covered += count
+            if covered >= coverage * total:
+                ranked = ranked[:i + 1]
+                break
+    if top is not None:
+        ranked = ranked[:top]
+    return ranked
+
+
+def write_char_list(path: Path, ranked: List[Tuple[int, int]], font_name: str, source: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'#{len(ranked)} most used characters of {source}\n')
+        f.write(f'#font:{font_name}\n')
+        for cp, _ in ranked:
+            f.write(chr(cp) + '\n')
+
+
+def write_counts(path: Path, ranked: List[Tuple[int, int]]):
+    with open(path, 'w', encoding='utf-8') as f:
+        for cp, count in ranked:
+            f.write(f'{cp:04X}\t{count}\n')
+
+
+def read_ranking(paths: List[Path]) -> Dict[int, int]:
+    """
+    Returns codepoint -> rank (0 is the most used) from character lists in the
+    lang/*.txt format, ranked by order of appearance, or from "codepoint<TAB>count"
+    files (*.tsv), ranked by count. Earlier files rank before later ones.
+    """
+    ranking: Dict[int, int] = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.suffix == '.tsv':
+                counts = []
+                for line in f:
+                    if line.strip():
+                        cp, count = line.split('\t')
+                        counts.append((int(cp, 16), int(count)))
+                codepoints = [cp for cp, _ in sorted(counts, key=lambda entry: (-entry[1], entry[0]))]
+            else:
+                codepoints = []
+                for line in f:
+                    line = line.strip()
+                    if line.startswith('#') or line == '':
+                        continue
+                    codepoints.extend(ord(ch) for ch in line)
+        for cp in codepoints:
+            if cp not in ranking:
+                ranking[cp] = len(ranking)
+    return ranking
+
+
+def po_unescape(string: str) -> str:
+    return re.sub(r'\\(.)', lambda m: {'n': '\n', 't': '\t'}.get(m.group(1), m.group(1)), string)
+
+
+def po_strings(f) -> Iterator[str]:
+    """Yields the translated strings (msgstr) of a gettext .po file, without the header entry."""
+    entry: Dict[str, List[str]] = {}
+    field = None
+    for line in list(f) + ['']:
+        line = line.strip()
+        if line.startswith('"') and field is not None:
+            entry[field].append(line[1:-1])
+            continue
+        if line.startswith('msgid ') or line == '':
+            # The header is the entry with an empty msgid
+            if ''.join(entry.get('msgid', [''])) != '' and entry.get('msgstr'):
+                yield po_unescape(''.join(entry['msgstr']))
+            entry = {}
+        field = None
+        for keyword in ('msgid', 'msgstr'):
+            if line.startswith(keyword + ' '):
+                field = keyword
+                entry[field] = [line[len(keyword):].strip()[1:-1]]
+
+
+def read_text_counts(path: Path, chunk_size: int = CHUNK_SIZE) -> Counter:
+    """
+    Counts the characters of a reference text, leaving out line breaks and
+    other control characters. Only the translated strings of .po files count.
+    """
+    counts: Counter = Counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix == '.po':
+            for string in po_strings(f):
+                counts.update(string)
+        else:
+            for chunk in iter(lambda: f.read(chunk_size), ''):
+                counts.update(chunk)
+    for ch in list(counts):
+        if unicodedata.category(ch) == 'Cc':
+            del counts[ch]
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a frequency-ranked lang/*.txt character list from UTF-8 text corpora.')
+    parser.add_argument('corpus', type=Path, nargs='+', help='corpus files or directories')
+    parser.add_argument('-o', '--output', type=Path, required=True, help='character list to write, e.g. lang/kanji.txt')
+    parser.add_argument('--font', required=True, help='font name from lang/fonts.json for the #font: line')
+    parser.add_argument('--include', help='only list characters matching this regular expression, e.g. [\\u4e00-\\u9fff]')
+    parser.add_argument('--top', type=int, help='list at most this many characters')
+    parser.add_argument('--coverage', type=float, help='stop once the listed characters cover this fraction of the characters matching --include, e.g. 0.99')
+    parser.add_argument('--min-count', type=int, default=1, help='skip characters seen fewer times')
+    parser.add_argument('--counts', type=Path, help='also write the "codepoint<TAB>count" list')
+    parser.add_argument('--jobs', type=int, help='number of worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='bytes per work item')
+    args = parser.parse_args()
+
+    counts = count_codepoints(args.corpus, args.jobs, args.chunk_size)
+    ranked = rank_codepoints(counts, args.include, args.top, args.coverage, args.min_count)
+    source = ', '.join(str(path) for path in args.corpus)
+    write_char_list(args.output, ranked, args.font, source)
+    if args.counts:
+        write_counts(args.counts, ranked)
+
+    matching = sum(count for _, count in matching_codepoints(counts, args.include))
+    listed = sum(count for _, count in ranked)
+    print(f"Counted {sum(counts)} characters, {matching} matching; listed {len(ranked)} covering "
+          f"{listed / matching if matching else 0:.2%} of the matching characters")
+    print("Saved: " + str(args.output))
@@ -0,0 +1,104 @@
+"""
+Index of the codepoints each font file can render.
+
+Coverage is kept as an integer bitset per font file (bit n set when codepoint
+n has a glyph), so checking a set of requested codepoints is a couple of
+integer operations. The index is cached on disk as codepoint ranges and only
+rebuilt for files whose size or modification time changed.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import freetype
+
+MAX_CODEPOINT = 0x10ffff
+
+
+def codepoints_bitset(codepoints: Iterable[int]) -> int:
+    bits = bytearray(MAX_CODEPOINT // 8 + 1)
+    for codepoint in codepoints:
+        bits[codepoint >> 3] |= 1 << (codepoint & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bitset_codepoints(bitset: int) -> List[int]:
+    codepoints = []
+    data = bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        if byte:
+            for bit in range(8):
+                if byte >> bit & 1:
+                    codepoints.append(index * 8 + bit)
+    return codepoints
+
+
+def ranges_bitset(ranges: Iterable[List[int]]) -> int:
+    bitset = 0
+    for start, end in ranges:
+        bitset |= ((1 << (end - start + 1)) - 1) << start
+    return bitset
+
+
+def bitset_ranges(bitset: int) -> List[List[int]]:
+    ranges = []
+    for codepoint in bitset_codepoints(bitset):
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return ranges
+
+
+def ttf_codepoints(path: str) -> List[int]:
+    face = freetype.Face(path)
+    codepoints = []
+    codepoint, gindex = face.get_first_char()
+    while gindex:
+        codepoints.append(codepoint)
+        codepoint, gindex = face.get_next_char(codepoint, gindex)
+    return codepoints
+
+
+def pbff_codepoints(path: str) -> List[int]:
+    with open(path, 'r') as f:
+        codepoints = [int(r.group(1)) for r in re.finditer(r'^glyph (\d+)', f.read(), re.MULTILINE)]
+    # merge_fonts skips the first glyph of a PBFF file, which is the wildcard
+    return codepoints[1:]
+
+
+class CoverageIndex:
+    def __init__(self, cache_path: Optional[Path] = None):
+        self.cache_path = cache_path
+        self.entries: Dict[str, dict] = {}
+        self.bitsets: Dict[str, int] = {}
+        self.changed = False
+        if cache_path is not None and cache_path.exists():
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def coverage(self, path: str) -> int:
+        """Returns the bitset of codepoints the TTF or PBFF file has glyphs for."""
+        if path in self.bitsets:
+            return self.bitsets[path]
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            codepoints = pbff_codepoints(path) if path.endswith('.pbff') else ttf_codepoints(path)
+            bitset = codepoints_bitset(codepoints)
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'ranges': bitset_ranges(bitset)}
+            self.entries[path] = entry
+            self.changed = True
+        else:
+            bitset = ranges_bitset(entry['ranges'])
+        self.bitsets[path] = bitset
+        return bitset
+
+    def save(self):
+        if self.cache_path is not None and self.changed:
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            self.changed = False
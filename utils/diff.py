@@ -0,0 +1,82 @@
+"""
+Glyph-level comparison of two language packs (.pbl files or build directories).
+
+    python -m utils.diff old.pbl build/
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict
+
+from utils.fontres import FONT_RESOURCE_KEYS, FontResource, format_codepoints, load_resources
+
+
+def diff_fonts(old: FontResource, new: FontResource) -> Dict[str, list]:
+    """Returns the added, removed and changed codepoints, compared by glyph content hash."""
+    old_hashes = old.glyph_hashes()
+    new_hashes = new.glyph_hashes()
+    return {
+        'added': sorted(new_hashes.keys() - old_hashes.keys()),
+        'removed': sorted(old_hashes.keys() - new_hashes.keys()),
+        'changed': sorted(cp for cp in old_hashes.keys() & new_hashes.keys() if old_hashes[cp] != new_hashes[cp]),
+    }
+
+
+def glyph_bytes(font: FontResource, codepoints) -> int:
+    """Bytes of the distinct glyph records used by the codepoints."""
+    offsets = set(font.offsets[cp] for cp in codepoints)
+    return sum(font.glyph_size(offset) for offset in offsets)
+
+
+def print_diff(old_path: Path, new_path: Path, verbose: bool = False) -> bool:
+    """Prints the differences per resource and returns whether there were any."""
+    old_resources = load_resources(old_path)
+    new_resources = load_resources(new_path)
+    differs = False
+
+    for key in sorted(old_resources.keys() | new_resources.keys()):
+        old_content = old_resources.get(key, b'')
+        new_content = new_resources.get(key, b'')
+        if old_content == new_content:
+            continue
+        differs = True
+        size = f"{len(old_content)} -> {len(new_content)} bytes ({len(new_content) - len(old_content):+d})"
+
+        if key not in FONT_RESOURCE_KEYS or not old_content or not new_content:
+            print(f"{key}: {size}")
+            continue
+
+        old_font = FontResource(old_content)
+        new_font = FontResource(new_content)
+        changes = diff_fonts(old_font, new_font)
+        print(f"{key}: {size}, {len(changes['added'])} added, {len(changes['removed'])} removed, "
+              f"{len(changes['changed'])} changed glyphs")
+        for name, attr in (('height', 'max_height'), ('hash table size', 'table_size'), ('codepoint bytes', 'codepoint_bytes')):
+            if getattr(old_font, attr) != getattr(new_font, attr):
+                print(f"  {name}: {getattr(old_font, attr)} -> {getattr(new_font, attr)}")
+        if changes['added']:
+            print(f"  added: +{glyph_bytes(new_font, changes['added'])} glyph bytes")
+        if changes['removed']:
+            print(f"  removed: -{glyph_bytes(old_font, changes['removed'])} glyph bytes")
+        if changes['changed']:
+            delta = glyph_bytes(new_font, changes['changed']) - glyph_bytes(old_font, changes['changed'])
+            print(f"  changed: {delta:+d} glyph bytes")
+        if verbose:
+            for name in ('added', 'removed', 'changed'):
+                if changes[name]:
+                    print(f"  {name} codepoints: {format_codepoints(changes[name])}")
+
+    if not differs:
+        print("No differences")
+    return differs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the glyphs of two language packs.')
+    parser.add_argument('old', type=Path, help='.pbl file or build directory')
+    parser.add_argument('new', type=Path, help='.pbl file or build directory')
+    parser.add_argument('-v', '--verbose', action='store_true', help='list the added, removed and changed codepoints')
+    args = parser.parse_args()
+
+    sys.exit(1 if print_diff(args.old, args.new, args.verbose) else 0)
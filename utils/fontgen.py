@@ -11,6 +11,7 @@ import sys
 import itertools
 import json
 from math import ceil
+from multiprocessing import Pool
 
 from utils.io import LinedFileReader
 
@@ -30,6 +31,7 @@ OFFSET_TABLE_MAX_SIZE = 128
 MAX_GLYPHS_EXTENDED = HASH_TABLE_SIZE * OFFSET_TABLE_MAX_SIZE
 MAX_GLYPHS = 256
 OFFSET_SIZE_BYTES = 4
+RENDER_CHUNK_SIZE = 128
 
 
 def grouper(n, iterable, fillvalue=None):
@@ -49,6 +51,45 @@ def bits(x):
         x = x >> 1
     return data
 
+def trim_glyph(glyph_bits: bytes) -> bytes:
+    """
+    Crops a packed glyph to the bounding box of its set pixels. Blank rows and
+    columns around the bitmap are dropped and offset_left/offset_top moved to
+    match, so the glyph renders the same with a smaller bitmap.
+    """
+    width, height, left, top, advance = struct.unpack_from('<BBbbb', glyph_bits)
+    if width == 0 or height == 0:
+        return glyph_bits
+
+    # Bits are stored row by row, least significant bit first
+    value = int.from_bytes(glyph_bits[5:], 'little')
+    row_mask = (1 << width) - 1
+    rows = [(value >> (row * width)) & row_mask for row in range(height)]
+    set_rows = [row for row in range(height) if rows[row]]
+    if not set_rows:
+        return struct.pack('<BBbbb', 0, 0, left, top, advance)
+
+    first_row, last_row = set_rows[0], set_rows[-1]
+    columns = 0
+    for row in rows:
+        columns |= row
+    first_column = (columns & -columns).bit_length() - 1
+    last_column = columns.bit_length() - 1
+
+    new_width = last_column - first_column + 1
+    new_height = last_row - first_row + 1
+    new_left = left + first_column
+    new_top = top + first_row
+    if (new_width, new_height) == (width, height) or new_left > 127 or new_top > 127:
+        return glyph_bits
+
+    value = 0
+    for index, row in enumerate(rows[first_row:last_row + 1]):
+        value |= (row >> first_column) << (index * new_width)
+    bitmap = value.to_bytes(ceil(new_width * new_height / 32) * 4, 'little')
+    return struct.pack('<BBbbb', new_width, new_height, new_left, new_top, advance) + bitmap
+
+
 def load_pbff_file(path: str) -> dict[int, dict[str, Any]]:
     """
     Source: https://github.com/pebble-dev/renaissance/blob/master/lib/pbff.py
@@ -176,6 +217,7 @@ class Font:
         self.offset_tables = [[] for _ in range(self.table_size)]
         self.heightoffset = 0
         self.fauxbold = False
+        self.trimmed_bytes = 0
 
     def set_tracking_adjust(self, adjust):
         self.tracking_adjust = adjust
@@ -186,6 +228,33 @@ class Font:
     def set_fauxbold(self, fauxbold):
         self.fauxbold = fauxbold
 
+    def set_table_size(self, table_size):
+        self.table_size = table_size
+        self.hash_table = [0] * self.table_size
+        self.offset_tables = [[] for _ in range(self.table_size)]
+
+    @classmethod
+    def from_render_key(cls, render_key: tuple) -> 'Font':
+        """Opens a new font (with its own FreeType face) that renders the same glyph bits."""
+        type_name, ttf_path, pbff_path, height, heightoffset, fauxbold, tracking_adjust, legacy = render_key
+        font = cls(FontType[type_name], ttf_path, pbff_path, height, MAX_GLYPHS_EXTENDED, legacy)
+        font.set_heightoffset(heightoffset)
+        font.set_fauxbold(fauxbold)
+        font.set_tracking_adjust(tracking_adjust)
+        return font
+
+    def source_key(self) -> tuple:
+        """Identifies the font file, independent of the rendering settings."""
+        return (self.type.name, self.ttf_path, self.pbff_path)
+
+    def render_key(self) -> tuple:
+        """Identifies every input that affects the rendered glyph bits."""
+        return self.source_key() + (self.max_height,
+                                    self.heightoffset,
+                                    self.fauxbold,
+                                    self.tracking_adjust,
+                                    self.legacy)
+
     def set_regex_filter(self, regex_string):
         if regex_string != ".*":
             try:
@@ -198,7 +267,7 @@ class Font:
     def set_codepoint_list(self, list_path):
         with open(list_path, "r", encoding="utf-8") as codepoints_file:
             codepoints_json = json.load(codepoints_file)
-            self.codepoints = [int(cp) for cp in codepoints_json["codepoints"]]
+            self.codepoints = set(int(cp) for cp in codepoints_json["codepoints"])
 
     def is_supported_glyph(self, codepoint):
         return (self.face.get_char_index(codepoint) > 0 or (codepoint == self.wildcard_codepoint))
@@ -230,6 +299,12 @@ class Font:
             gindex = self.pbff_glyphs_list_cursor_index
             return codepoint, gindex
     
+    def render_glyph(self, codepoint, gindex) -> bytes:
+        if self.type == FontType.TTF:
+            return self.glyph_bits_ttf(gindex)
+        else:  # assuming PBFF
+            return self.glyph_bits_pbff(codepoint)
+
     def glyph_bits_pbff(self, codepoint) -> bytes:
         def get_bytes(bits):
             while len(bits):
@@ -309,8 +384,12 @@ class Font:
                     row.extend(bits(bitmap.buffer[i * bitmap.pitch + j]))
                 glyph_bitmap.extend(row[:bitmap.width])
         elif pixel_mode == 2:  # grey font, 255 bits per pixel
-            for val in bitmap.buffer:
-                glyph_bitmap.extend([1 if val > 127 else 0])
+            for i in range(bitmap.rows):
+                row_start = i * bitmap.pitch
+                row = [1 if val > 127 else 0 for val in bitmap.buffer[row_start:row_start + bitmap.width]]
+                if self.fauxbold:  # widen every stroke by one pixel to the right, like the monochrome faux bold
+                    row = [pixel | left_pixel for pixel, left_pixel in zip(row + [0], [0] + row)]
+                glyph_bitmap.extend(row)
         else:
             raise Exception("Unsupported pixel mode: {}".format(pixel_mode))
 
@@ -339,3 +418,92 @@ class Font:
             btstr += b''.join(table)
         btstr += b''.join(self.glyph_table)
         return btstr
+
+
+# render key -> font opened by this worker process, so every worker renders on its own FreeType face
+_worker_fonts: dict[tuple, Font] = {}
+
+
+def render_chunk(render_key: tuple, chars: list[tuple[int, int]]) -> list[bytes]:
+    """Renders the (codepoint, gindex) pairs in a worker process."""
+    font = _worker_fonts.get(render_key)
+    if font is None:
+        font = _worker_fonts[render_key] = Font.from_render_key(render_key)
+    return [font.render_glyph(codepoint, gindex) for codepoint, gindex in chars]
+
+
+class GlyphPool:
+    """Shared cache of character maps and rendered glyphs.
+
+    Fonts built from the same file with the same rendering settings produce
+    the same glyph bits, so a pool shared between several merges (e.g. when
+    building many packs in one run) renders each distinct glyph only once.
+    """
+
+    def __init__(self):
+        self.charmaps: dict[tuple, list[tuple[int, int]]] = {}
+        self.glyphs: dict[tuple, bytes] = {}
+        # glyphs rendered ahead by prerender and not requested yet
+        self.prerendered: set[tuple] = set()
+        self.rendered = 0
+        self.reused = 0
+
+    def chars(self, font: Font) -> list[tuple[int, int]]:
+        """Returns the (codepoint, gindex) pairs of the font in charmap order."""
+        key = font.source_key()
+        if key not in self.charmaps:
+            chars = []
+            codepoint, gindex = font.get_first_char()
+            while gindex:
+                chars.append((codepoint, gindex))
+                codepoint, gindex = font.get_next_char(codepoint, gindex)
+            self.charmaps[key] = chars
+        return self.charmaps[key]
+
+    def glyph_key(self, font: Font, codepoint: int, gindex: int) -> tuple:
+        glyph_id = gindex if font.type == FontType.TTF else codepoint
+        return font.render_key() + (glyph_id,)
+
+    def glyph_bits(self, font: Font, codepoint: int, gindex: int) -> bytes:
+        key = self.glyph_key(font, codepoint, gindex)
+        glyph_bits = self.glyphs.get(key)
+        if glyph_bits is None:
+            glyph_bits = font.render_glyph(codepoint, gindex)
+            self.glyphs[key] = glyph_bits
+            self.rendered += 1
+        elif key in self.prerendered:
+            self.prerendered.remove(key)
+            self.rendered += 1
+        else:
+            self.reused += 1
+        return glyph_bits
+
+    def prerender(self, requests: list[tuple[Font, list[tuple[int, int]]]], jobs: int,
+                  chunk_size: int = RENDER_CHUNK_SIZE):
+        """Renders the glyphs not in the pool yet, given as (font, [(codepoint, gindex)]), in worker processes.
+
+        The glyphs are split into chunks of chunk_size that the workers render
+        on faces of their own. The results come back in chunk order and only
+        fill the cache, so merging afterwards assigns the same offsets as a
+        serial build.
+        """
+        chunks = []
+        for font, chars in requests:
+            pending = {}
+            for codepoint, gindex in chars:
+                key = self.glyph_key(font, codepoint, gindex)
+                if key not in self.glyphs and key not in pending:
+                    pending[key] = (codepoint, gindex)
+            keys = list(pending)
+            for start in range(0, len(keys), chunk_size):
+                chunk_keys = keys[start:start + chunk_size]
+                chunks.append((font.render_key(), chunk_keys, [pending[key] for key in chunk_keys]))
+        if len(chunks) < 2 or jobs < 2:
+            return
+
+        with Pool(min(jobs, len(chunks))) as pool:
+            results = pool.starmap(render_chunk, [(render_key, chars) for render_key, _, chars in chunks])
+        for (_, chunk_keys, _), glyphs in zip(chunks, results):
+            for key, glyph_bits in zip(chunk_keys, glyphs):
+                self.glyphs[key] = glyph_bits
+                self.prerendered.add(key)
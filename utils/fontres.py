@@ -0,0 +1,138 @@
+"""
+Reading of built font resources and language packs.
+
+A font resource is laid out as written by `Font.bitstring`: the header, the
+hash table, the offset tables of all buckets, then the glyph table whose
+first word is left empty.
+"""
+
+import hashlib
+import struct
+from math import ceil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils.pbpack import ResourcePack
+
+HEADER_FMT = '<BBHHBB'
+HEADER_SIZE_BYTES = struct.calcsize(HEADER_FMT)
+HASH_TABLE_ENTRY_FMT = '<BBH'
+HASH_TABLE_ENTRY_SIZE_BYTES = struct.calcsize(HASH_TABLE_ENTRY_FMT)
+GLYPH_HEADER_FMT = '<BBbbb'
+GLYPH_HEADER_SIZE_BYTES = struct.calcsize(GLYPH_HEADER_FMT)
+RESOURCE_KEYS = [str(i).zfill(3) for i in range(0, 21)]
+FONT_RESOURCE_KEYS = RESOURCE_KEYS[1:]
+
+
+class FontResource:
+    def __init__(self, data: bytes):
+        self.data = data
+        (self.version,
+         self.max_height,
+         self.number_of_glyphs,
+         self.wildcard_codepoint,
+         self.table_size,
+         self.codepoint_bytes) = struct.unpack_from(HEADER_FMT, data)
+
+        self.hash_table_start = HEADER_SIZE_BYTES
+        self.offset_tables_start = self.hash_table_start + self.table_size * HASH_TABLE_ENTRY_SIZE_BYTES
+        self.hash_table: List[Tuple[int, int, int]] = [
+            struct.unpack_from(HASH_TABLE_ENTRY_FMT, data, self.hash_table_start + i * HASH_TABLE_ENTRY_SIZE_BYTES)
+            for i in range(self.table_size)]
+
+        entry_format = '<LL' if self.codepoint_bytes == 4 else '<HL'
+        self.offset_entry_size = struct.calcsize(entry_format)
+        self.buckets: List[List[Tuple[int, int]]] = []
+        offset_tables_end = self.offset_tables_start
+        for _, bucket_size, bucket_offset in self.hash_table:
+            start = self.offset_tables_start + bucket_offset
+            end = start + bucket_size * self.offset_entry_size
+            self.buckets.append(list(struct.iter_unpack(entry_format, data[start:end])))
+            offset_tables_end = max(offset_tables_end, end)
+        self.glyph_table_start = offset_tables_end
+
+        # codepoint -> glyph offset, relative to the glyph table
+        self.offsets: Dict[int, int] = {}
+        for bucket in self.buckets:
+            for codepoint, offset in bucket:
+                self.offsets.setdefault(codepoint, offset)
+
+    @property
+    def header_bytes(self) -> int:
+        return HEADER_SIZE_BYTES
+
+    @property
+    def hash_table_bytes(self) -> int:
+        return self.offset_tables_start - self.hash_table_start
+
+    @property
+    def offset_tables_bytes(self) -> int:
+        return self.glyph_table_start - self.offset_tables_start
+
+    @property
+    def glyph_table_bytes(self) -> int:
+        return len(self.data) - self.glyph_table_start
+
+    def glyph_size(self, offset: int) -> int:
+        width, height = struct.unpack_from('<BB', self.data, self.glyph_table_start + offset)
+        return GLYPH_HEADER_SIZE_BYTES + ceil(width * height / 32) * 4
+
+    def glyph(self, codepoint: int) -> bytes:
+        """Returns the glyph record (header and bitmap) of the codepoint."""
+        offset = self.offsets[codepoint]
+        start = self.glyph_table_start + offset
+        return self.data[start:start + self.glyph_size(offset)]
+
+    def glyph_hashes(self) -> Dict[int, bytes]:
+        """Returns codepoint -> content hash of its glyph record. Shared glyphs are hashed once."""
+        by_offset: Dict[int, bytes] = {}
+        hashes = {}
+        for codepoint, offset in self.offsets.items():
+            digest = by_offset.get(offset)
+            if digest is None:
+                start = self.glyph_table_start + offset
+                record = self.data[start:start + self.glyph_size(offset)]
+                digest = by_offset[offset] = hashlib.blake2b(record, digest_size=16).digest()
+            hashes[codepoint] = digest
+        return hashes
+
+
+def load_resources(path: Path) -> Dict[str, bytes]:
+    """
+    Returns the resources ('000' to '020') of a language pack, read from a
+    .pbl file or from a build directory.
+    """
+    resources = {}
+    if path.is_dir():
+        for key in RESOURCE_KEYS:
+            if (path / key).exists():
+                with open(path / key, 'rb') as f:
+                    resources[key] = f.read()
+    else:
+        with open(path, 'rb') as f:
+            pack = ResourcePack.deserialize(f)
+        for key, content in zip(RESOURCE_KEYS, pack.contents):
+            resources[key] = content
+    return resources
+
+
+def load_fonts(path: Path) -> Dict[str, FontResource]:
+    """Returns the non-empty font resources of a language pack, by resource key."""
+    return dict((key, FontResource(content)) for key, content in load_resources(path).items()
+                if key in FONT_RESOURCE_KEYS and len(content) != 0)
+
+
+def format_codepoints(codepoints: List[int], max_ranges: Optional[int] = None) -> str:
+    """Formats sorted codepoints as ranges, e.g. U+3041-U+3096 U+30FC."""
+    ranges = []
+    for codepoint in codepoints:
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    formatted = ' '.join(f'U+{start:04X}' if start == end else f'U+{start:04X}-U+{end:04X}'
+                         for start, end in ranges[:max_ranges])
+    if max_ranges is not None and len(ranges) > max_ranges:
+        formatted += ' ...'
+    return formatted
+
@@ -0,0 +1,82 @@
+"""
+Hash table layout of font resources and its lookup cost on the watch.
+
+The firmware finds a glyph by hashing the codepoint into the hash table
+(`hasher`) and scanning that bucket's offset table entry by entry, so the cost
+of a lookup is the position of the codepoint in its bucket.
+"""
+
+import time
+from typing import List, NamedTuple, Optional
+
+import utils.fontgen as fg
+
+# The table size is stored in a single byte of the font header
+MIN_TABLE_SIZE = 1
+MAX_TABLE_SIZE = 255
+
+
+class TableSizeChoice(NamedTuple):
+    table_size: int
+    max_bucket: int
+    mean_comparisons: float
+    baseline_max_bucket: int
+    baseline_mean_comparisons: float
+    tried: int
+
+    def __str__(self):
+        ratio = self.mean_comparisons / self.baseline_mean_comparisons if self.baseline_mean_comparisons else 1
+        return (f"hash table size {self.table_size} (tried {self.tried}): "
+                f"max bucket {self.baseline_max_bucket} -> {self.max_bucket}, "
+                f"mean comparisons {self.baseline_mean_comparisons:.2f} -> {self.mean_comparisons:.2f} "
+                f"({ratio:.0%} of size {fg.HASH_TABLE_SIZE})")
+
+
+def bucket_sizes(codepoints: List[int], table_size: int) -> List[int]:
+    sizes = [0] * table_size
+    for codepoint in codepoints:
+        sizes[fg.hasher(codepoint, table_size)] += 1
+    return sizes
+
+
+def mean_comparisons(sizes: List[int]) -> float:
+    """Mean number of offset table entries compared to find a glyph of the font."""
+    count = sum(sizes)
+    if count == 0:
+        return 0
+    # The entries of a bucket of k glyphs take 1 + 2 + ... + k comparisons
+    return sum(k * (k + 1) for k in sizes) / 2 / count
+
+
+def optimize_table_size(codepoints: List[int],
+                        max_size: int = MAX_TABLE_SIZE,
+                        time_budget: Optional[float] = None) -> TableSizeChoice:
+    """
+    Picks the table size with the fewest mean comparisons per lookup, then the
+    smallest longest bucket, then the smallest table. Sizes are tried from
+    max_size downwards until time_budget seconds have passed; sizes that
+    would overflow a bucket are skipped.
+    """
+    max_size = max(MIN_TABLE_SIZE, min(max_size, MAX_TABLE_SIZE))
+    baseline = bucket_sizes(codepoints, fg.HASH_TABLE_SIZE)
+    baseline_mean = mean_comparisons(baseline)
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+
+    best = None
+    tried = 0
+    for table_size in range(max_size, MIN_TABLE_SIZE - 1, -1):
+        if deadline is not None and tried and time.monotonic() > deadline:
+            break
+        tried += 1
+        sizes = bucket_sizes(codepoints, table_size)
+        longest = max(sizes)
+        if longest > fg.OFFSET_TABLE_MAX_SIZE:
+            continue
+        rank = (mean_comparisons(sizes), longest, table_size)
+        if best is None or rank < best:
+            best = rank
+
+    if best is None:
+        raise ValueError(f"No hash table size up to {max_size} keeps every bucket within {fg.OFFSET_TABLE_MAX_SIZE} glyphs")
+    mean, longest, table_size = best
+    return TableSizeChoice(table_size, longest, mean, max(baseline), baseline_mean, tried)
@@ -132,9 +132,10 @@ class ResourcePack(object):
             index = len(self.contents) - 1
         self.table.append(index)
 
-    def __init__(self):
+    def __init__(self, timestamp=None):
+        # a fixed timestamp makes identical builds produce identical files
         self.num_files = 0
-        self.timestamp = int(time.time())
+        self.timestamp = int(time.time()) if timestamp is None else timestamp
         self.contents = []
         self.table_entries = []
         self.table = []
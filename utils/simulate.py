@@ -0,0 +1,110 @@
+"""
+Replays text against built font resources to estimate the cost of glyph
+lookups on the watch.
+
+Every character follows the firmware's path: `hasher` picks a hash table
+entry, the bucket's offset table is scanned entry by entry, then the glyph is
+read. A character the font lacks scans its whole bucket and falls back to the
+wildcard glyph. The cost of each distinct codepoint is computed once, so the
+text itself is only counted, which runs at the speed of `Counter`.
+
+    python -m utils.simulate build/langpack.pbl translation/000.po notifications.log
+"""
+
+import argparse
+import copy
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, NamedTuple
+
+import utils.fontgen as fg
+from utils.corpus import read_text_counts
+from utils.fontres import HASH_TABLE_ENTRY_SIZE_BYTES, FontResource, format_codepoints, load_fonts
+
+
+class LookupCost(NamedTuple):
+    comparisons: int
+    bytes_touched: int
+    hit: bool
+
+
+class ReplayResult(NamedTuple):
+    characters: int
+    comparisons: int
+    bytes_touched: int
+    misses: int
+    missing: List[int]
+
+    @property
+    def comparisons_per_character(self) -> float:
+        return self.comparisons / (self.characters or 1)
+
+    def __str__(self):
+        characters = self.characters or 1
+        return (f"{self.characters} characters, {self.comparisons_per_character:.2f} comparisons/char, "
+                f"{self.bytes_touched / characters:.1f} bytes/char, "
+                f"{self.misses} misses ({self.misses / characters:.2%}) on {len(self.missing)} codepoints")
+
+
+def bucket_scan(font: FontResource, codepoint: int) -> tuple:
+    """Returns (entries compared, glyph offset or None) for scanning the codepoint's bucket."""
+    bucket = font.buckets[fg.hasher(codepoint, font.table_size)]
+    for position, (entry_codepoint, offset) in enumerate(bucket, start=1):
+        if entry_codepoint == codepoint:
+            return position, offset
+    return len(bucket), None
+
+
+def lookup_cost(font: FontResource, codepoint: int) -> LookupCost:
+    comparisons, offset = bucket_scan(font, codepoint)
+    bytes_touched = HASH_TABLE_ENTRY_SIZE_BYTES + comparisons * font.offset_entry_size
+    hit = offset is not None
+    if not hit:
+        wildcard_comparisons, offset = bucket_scan(font, font.wildcard_codepoint)
+        comparisons += wildcard_comparisons
+        bytes_touched += HASH_TABLE_ENTRY_SIZE_BYTES + wildcard_comparisons * font.offset_entry_size
+    if offset is not None:
+        bytes_touched += font.glyph_size(offset)
+    return LookupCost(comparisons, bytes_touched, hit)
+
+
+def codepoint_order(font: FontResource) -> FontResource:
+    """Returns a copy of the font with every bucket scanned in codepoint order, as built without --rank."""
+    ordered = copy.copy(font)
+    ordered.buckets = [sorted(bucket) for bucket in font.buckets]
+    return ordered
+
+
+def replay(font: FontResource, counts: Counter) -> ReplayResult:
+    comparisons = bytes_touched = misses = 0
+    missing = []
+    for ch, count in counts.items():
+        cost = lookup_cost(font, ord(ch))
+        comparisons += cost.comparisons * count
+        bytes_touched += cost.bytes_touched * count
+        if not cost.hit:
+            misses += count
+            missing.append(ord(ch))
+    return ReplayResult(sum(counts.values()), comparisons, bytes_touched, misses, sorted(missing))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Estimate the on-watch glyph lookup cost of a language pack for real text.')
+    parser.add_argument('pack', type=Path, help='.pbl file or build directory')
+    parser.add_argument('text', type=Path, nargs='+', help='UTF-8 text files to replay; only the translations of .po files are used')
+    parser.add_argument('-v', '--verbose', action='store_true', help='list the codepoints that fall back to the wildcard glyph')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    counts: Counter = Counter()
+    for path in args.text:
+        counts.update(read_text_counts(path))
+    fonts = load_fonts(args.pack)
+    for key, font in fonts.items():
+        result = replay(font, counts)
+        print(f"{key}: {result}")
+        if args.verbose and result.missing:
+            print(f"  missing: {format_codepoints(result.missing)}")
+    elapsed = time.monotonic() - start
+    print(f"Replayed {sum(counts.values())} characters against {len(fonts)} variants in {elapsed:.2f}s")
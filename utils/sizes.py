@@ -0,0 +1,183 @@
+"""
+Size profile of a language pack (.pbl file or build directory).
+
+Every font resource is split into header, hash table, offset tables and glyph
+table, and the glyph bytes are grouped by Unicode block and by the source
+font the build took them from (recorded in the build directory's
+sources.json). With --history, the variant sizes are appended to a JSON file
+and the run fails when a variant grew by more than --max-growth percent since
+the previous entry, which lets CI catch pack growth.
+
+    python -m utils.sizes build/ --history sizes.json --max-growth 5
+"""
+
+import argparse
+import json
+import sys
+import time
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import utils.fontgen as fg
+from utils.fontres import FONT_RESOURCE_KEYS, FontResource, format_codepoints, load_resources
+from utils.unicode_blocks import unicode_block
+
+# font name -> codepoint ranges each variant took from it, written by build.py
+SOURCES_FILE = 'sources.json'
+
+
+class FontSizes(NamedTuple):
+    total: int
+    header: int
+    hash_table: int
+    offset_tables: int
+    glyphs: int
+    astral_codepoints: List[int]
+    # bytes that 4-byte codepoints add to the offset tables
+    astral_cost: int
+    by_block: Dict[str, int]
+    by_font: Dict[str, int]
+
+
+class SourceLookup:
+    """Maps codepoints to the font they were taken from, given font name -> [[start, end], ...]."""
+
+    def __init__(self, sources: Dict[str, List[List[int]]]):
+        ranges = sorted((start, end, font_name) for font_name, font_ranges in sources.items()
+                        for start, end in font_ranges)
+        self.starts = [start for start, _, _ in ranges]
+        self.ranges = ranges
+
+    def font(self, codepoint: int) -> Optional[str]:
+        i = bisect_right(self.starts, codepoint) - 1
+        if i >= 0 and codepoint <= self.ranges[i][1]:
+            return self.ranges[i][2]
+        return None
+
+
+def font_sizes(font: FontResource, sources: Optional[SourceLookup] = None) -> FontSizes:
+    by_block: Dict[str, int] = {}
+    by_font: Dict[str, int] = {}
+    # a glyph record shared by several codepoints is counted once, for the lowest of them
+    seen_offsets = set()
+    for codepoint in sorted(font.offsets):
+        offset = font.offsets[codepoint]
+        if offset in seen_offsets:
+            continue
+        seen_offsets.add(offset)
+        size = font.glyph_size(offset)
+        block = unicode_block(codepoint)
+        by_block[block] = by_block.get(block, 0) + size
+        font_name = sources.font(codepoint) if sources is not None else None
+        if codepoint == font.wildcard_codepoint:
+            font_name = 'wildcard'
+        elif font_name is None:
+            # the build adds the ellipsis to every variant from the first font that has it
+            font_name = 'ellipsis' if codepoint == fg.ELLIPSIS_CODEPOINT else 'unknown'
+        by_font[font_name] = by_font.get(font_name, 0) + size
+
+    astral_codepoints = sorted(cp for cp in font.offsets if cp > fg.MAX_2_BYTES_CODEPOINT)
+    entries = sum(len(bucket) for bucket in font.buckets)
+    astral_cost = entries * 2 if font.codepoint_bytes == 4 else 0
+    return FontSizes(len(font.data), font.header_bytes, font.hash_table_bytes, font.offset_tables_bytes,
+                     font.glyph_table_bytes, astral_codepoints, astral_cost, by_block, by_font)
+
+
+def format_shares(sizes: Dict[str, int], total: int, limit: Optional[int] = None) -> str:
+    ordered = sorted(sizes.items(), key=lambda item: (-item[1], item[0]))
+    formatted = ', '.join(f"{name} {size} ({size / (total or 1):.0%})" for name, size in ordered[:limit])
+    if limit is not None and len(ordered) > limit:
+        formatted += f", {len(ordered) - limit} more"
+    return formatted
+
+
+def read_sources(path: Path) -> Dict[str, dict]:
+    """Returns variant -> font name -> codepoint ranges, or nothing when the file does not exist."""
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def print_sizes(pack_path: Path, sources_path: Optional[Path] = None, verbose: bool = False) -> Dict[str, int]:
+    """Prints the size profile of every resource and returns resource key -> size."""
+    if sources_path is None and pack_path.is_dir():
+        sources_path = pack_path / SOURCES_FILE
+    sources = read_sources(sources_path) if sources_path is not None else {}
+    resources = load_resources(pack_path)
+    limit = None if verbose else 5
+
+    sizes = {}
+    for key, content in resources.items():
+        sizes[key] = len(content)
+        if key not in FONT_RESOURCE_KEYS or not content:
+            print(f"{key}: {len(content)} bytes")
+            continue
+        lookup = SourceLookup(sources[key]) if key in sources else None
+        font_size = font_sizes(FontResource(content), lookup)
+        print(f"{key}: {font_size.total} bytes: header {font_size.header}, hash table {font_size.hash_table}, "
+              f"offset tables {font_size.offset_tables}, glyphs {font_size.glyphs}")
+        if font_size.astral_cost:
+            print(f"  4-byte codepoints because of {format_codepoints(font_size.astral_codepoints, max_ranges=4)}, "
+                  f"adding {font_size.astral_cost} offset table bytes")
+        print(f"  by block: {format_shares(font_size.by_block, font_size.glyphs, limit)}")
+        print(f"  by font: {format_shares(font_size.by_font, font_size.glyphs, limit)}")
+    print(f"Total: {sum(sizes.values())} bytes of resources")
+    return sizes
+
+
+def check_history(history_path: Path, sizes: Dict[str, int], max_growth: Optional[float], label: Optional[str]) -> bool:
+    """
+    Compares the sizes with the last entry of the history file and appends
+    them when no resource grew by more than max_growth percent. A resource
+    that was empty in the last entry fails any max_growth. Returns whether
+    the check passed.
+    """
+    history = []
+    if history_path.exists():
+        with open(history_path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+
+    passed = True
+    if history:
+        previous = history[-1]['sizes']
+        for key, size in sizes.items():
+            old_size = previous.get(key, 0)
+            if size == old_size:
+                continue
+            if old_size == 0:
+                # any growth of an empty resource is more than every percentage
+                print(f"{key}: 0 -> {size} bytes (new content)")
+                if max_growth is not None:
+                    print("  error: was empty in the last entry")
+                    passed = False
+                continue
+            growth = (size - old_size) / old_size * 100
+            print(f"{key}: {old_size} -> {size} bytes ({growth:+.1f}%)")
+            if max_growth is not None and growth > max_growth:
+                print(f"  error: grew by more than {max_growth}%")
+                passed = False
+
+    if passed:
+        history.append({'time': int(time.time()), 'label': label, 'sizes': sizes})
+        with open(history_path, 'w', encoding='utf-8') as f:
+            json.dump(history, f, indent=1)
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show what takes up the space in a language pack.')
+    parser.add_argument('pack', type=Path, help='.pbl file or build directory')
+    parser.add_argument('--sources', type=Path,
+                        help=f'{SOURCES_FILE} of the build, to group glyphs by source font (default: the one in a build directory)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='list every block and font instead of the largest five')
+    parser.add_argument('--history', type=Path, help='JSON file of earlier sizes to compare with and append to')
+    parser.add_argument('--max-growth', type=float, metavar='PERCENT',
+                        help='with --history, fail when a resource grew by more than this since the last entry')
+    parser.add_argument('--label', help='with --history, a name for this entry, e.g. the commit')
+    args = parser.parse_args()
+
+    sizes = print_sizes(args.pack, args.sources, args.verbose)
+    if args.history is not None and not check_history(args.history, sizes, args.max_growth, args.label):
+        sys.exit(1)
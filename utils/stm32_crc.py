@@ -31,14 +31,36 @@ def process_word(data, crc=0xffffffff):
     result = crc & 0xffffffff
     return result
 
-def process_buffer(buf, c = 0xffffffff):
-    word_count = len(buf) // 4
-    if (len(buf) % 4 != 0):
-        word_count += 1
+def make_table():
+    # CRC of each byte shifted into the top of the register, 8 bits at a time
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for i in range(8):
+            if (crc & 0x80000000) != 0:
+                crc = ((crc << 1) ^ CRC_POLY) & 0xffffffff
+            else:
+                crc = (crc << 1) & 0xffffffff
+        table.append(crc)
+    return table
+
+CRC_TABLE = make_table()
 
+def process_buffer(buf, c = 0xffffffff):
+    # Whole words are processed a byte at a time through the lookup table,
+    # which gives the same result as process_word's bitwise loop
+    whole_words = len(buf) // 4 * 4
+    table = CRC_TABLE
     crc = c
-    for i in range(0, word_count):
-        crc = process_word(buf[i * 4 : (i + 1) * 4], crc)
+    for d in array.array('I', bytes(buf[:whole_words])):
+        crc ^= d
+        crc = ((crc << 8) & 0xffffffff) ^ table[crc >> 24]
+        crc = ((crc << 8) & 0xffffffff) ^ table[crc >> 24]
+        crc = ((crc << 8) & 0xffffffff) ^ table[crc >> 24]
+        crc = ((crc << 8) & 0xffffffff) ^ table[crc >> 24]
+
+    if (len(buf) % 4 != 0):
+        crc = process_word(buf[whole_words:], crc)
     return crc
 
 def crc32(data):
@@ -0,0 +1,117 @@
+"""
+Unicode block lookup for reports. Only the blocks a language pack is likely
+to use are listed; other codepoints are grouped by their 128-codepoint range.
+"""
+
+from bisect import bisect_right
+
+# (first codepoint, last codepoint, block name), sorted by first codepoint
+UNICODE_BLOCKS = [
+    (0x0000, 0x007F, 'Basic Latin'),
+    (0x0080, 0x00FF, 'Latin-1 Supplement'),
+    (0x0100, 0x017F, 'Latin Extended-A'),
+    (0x0180, 0x024F, 'Latin Extended-B'),
+    (0x0250, 0x02AF, 'IPA Extensions'),
+    (0x02B0, 0x02FF, 'Spacing Modifier Letters'),
+    (0x0300, 0x036F, 'Combining Diacritical Marks'),
+    (0x0370, 0x03FF, 'Greek and Coptic'),
+    (0x0400, 0x04FF, 'Cyrillic'),
+    (0x0500, 0x052F, 'Cyrillic Supplement'),
+    (0x0530, 0x058F, 'Armenian'),
+    (0x0590, 0x05FF, 'Hebrew'),
+    (0x0600, 0x06FF, 'Arabic'),
+    (0x0700, 0x074F, 'Syriac'),
+    (0x0750, 0x077F, 'Arabic Supplement'),
+    (0x0780, 0x07BF, 'Thaana'),
+    (0x0900, 0x097F, 'Devanagari'),
+    (0x0980, 0x09FF, 'Bengali'),
+    (0x0A00, 0x0A7F, 'Gurmukhi'),
+    (0x0A80, 0x0AFF, 'Gujarati'),
+    (0x0B00, 0x0B7F, 'Oriya'),
+    (0x0B80, 0x0BFF, 'Tamil'),
+    (0x0C00, 0x0C7F, 'Telugu'),
+    (0x0C80, 0x0CFF, 'Kannada'),
+    (0x0D00, 0x0D7F, 'Malayalam'),
+    (0x0D80, 0x0DFF, 'Sinhala'),
+    (0x0E00, 0x0E7F, 'Thai'),
+    (0x0E80, 0x0EFF, 'Lao'),
+    (0x0F00, 0x0FFF, 'Tibetan'),
+    (0x1000, 0x109F, 'Myanmar'),
+    (0x10A0, 0x10FF, 'Georgian'),
+    (0x1100, 0x11FF, 'Hangul Jamo'),
+    (0x1200, 0x137F, 'Ethiopic'),
+    (0x13A0, 0x13FF, 'Cherokee'),
+    (0x1400, 0x167F, 'Unified Canadian Aboriginal Syllabics'),
+    (0x1780, 0x17FF, 'Khmer'),
+    (0x1800, 0x18AF, 'Mongolian'),
+    (0x1E00, 0x1EFF, 'Latin Extended Additional'),
+    (0x1F00, 0x1FFF, 'Greek Extended'),
+    (0x2000, 0x206F, 'General Punctuation'),
+    (0x2070, 0x209F, 'Superscripts and Subscripts'),
+    (0x20A0, 0x20CF, 'Currency Symbols'),
+    (0x20D0, 0x20FF, 'Combining Diacritical Marks for Symbols'),
+    (0x2100, 0x214F, 'Letterlike Symbols'),
+    (0x2150, 0x218F, 'Number Forms'),
+    (0x2190, 0x21FF, 'Arrows'),
+    (0x2200, 0x22FF, 'Mathematical Operators'),
+    (0x2300, 0x23FF, 'Miscellaneous Technical'),
+    (0x2400, 0x243F, 'Control Pictures'),
+    (0x2440, 0x245F, 'Optical Character Recognition'),
+    (0x2460, 0x24FF, 'Enclosed Alphanumerics'),
+    (0x2500, 0x257F, 'Box Drawing'),
+    (0x2580, 0x259F, 'Block Elements'),
+    (0x25A0, 0x25FF, 'Geometric Shapes'),
+    (0x2600, 0x26FF, 'Miscellaneous Symbols'),
+    (0x2700, 0x27BF, 'Dingbats'),
+    (0x27C0, 0x27EF, 'Miscellaneous Mathematical Symbols-A'),
+    (0x27F0, 0x27FF, 'Supplemental Arrows-A'),
+    (0x2800, 0x28FF, 'Braille Patterns'),
+    (0x2900, 0x297F, 'Supplemental Arrows-B'),
+    (0x2980, 0x29FF, 'Miscellaneous Mathematical Symbols-B'),
+    (0x2A00, 0x2AFF, 'Supplemental Mathematical Operators'),
+    (0x2B00, 0x2BFF, 'Miscellaneous Symbols and Arrows'),
+    (0x2E80, 0x2EFF, 'CJK Radicals Supplement'),
+    (0x2F00, 0x2FDF, 'Kangxi Radicals'),
+    (0x3000, 0x303F, 'CJK Symbols and Punctuation'),
+    (0x3040, 0x309F, 'Hiragana'),
+    (0x30A0, 0x30FF, 'Katakana'),
+    (0x3100, 0x312F, 'Bopomofo'),
+    (0x3130, 0x318F, 'Hangul Compatibility Jamo'),
+    (0x3190, 0x319F, 'Kanbun'),
+    (0x31A0, 0x31BF, 'Bopomofo Extended'),
+    (0x31C0, 0x31EF, 'CJK Strokes'),
+    (0x31F0, 0x31FF, 'Katakana Phonetic Extensions'),
+    (0x3200, 0x32FF, 'Enclosed CJK Letters and Months'),
+    (0x3300, 0x33FF, 'CJK Compatibility'),
+    (0x3400, 0x4DBF, 'CJK Unified Ideographs Extension A'),
+    (0x4DC0, 0x4DFF, 'Yijing Hexagram Symbols'),
+    (0x4E00, 0x9FFF, 'CJK Unified Ideographs'),
+    (0xA000, 0xA48F, 'Yi Syllables'),
+    (0xAC00, 0xD7AF, 'Hangul Syllables'),
+    (0xE000, 0xF8FF, 'Private Use Area'),
+    (0xF900, 0xFAFF, 'CJK Compatibility Ideographs'),
+    (0xFB00, 0xFB4F, 'Alphabetic Presentation Forms'),
+    (0xFB50, 0xFDFF, 'Arabic Presentation Forms-A'),
+    (0xFE00, 0xFE0F, 'Variation Selectors'),
+    (0xFE30, 0xFE4F, 'CJK Compatibility Forms'),
+    (0xFE50, 0xFE6F, 'Small Form Variants'),
+    (0xFE70, 0xFEFF, 'Arabic Presentation Forms-B'),
+    (0xFF00, 0xFFEF, 'Halfwidth and Fullwidth Forms'),
+    (0xFFF0, 0xFFFF, 'Specials'),
+    (0x1F300, 0x1F5FF, 'Miscellaneous Symbols and Pictographs'),
+    (0x1F600, 0x1F64F, 'Emoticons'),
+    (0x1F680, 0x1F6FF, 'Transport and Map Symbols'),
+    (0x1F900, 0x1F9FF, 'Supplemental Symbols and Pictographs'),
+    (0x20000, 0x2A6DF, 'CJK Unified Ideographs Extension B'),
+]
+BLOCK_STARTS = [start for start, _, _ in UNICODE_BLOCKS]
+
+
+def unicode_block(codepoint: int) -> str:
+    i = bisect_right(BLOCK_STARTS, codepoint) - 1
+    if i >= 0:
+        start, end, name = UNICODE_BLOCKS[i]
+        if codepoint <= end:
+            return name
+    start = codepoint // 128 * 128
+    return f'U+{start:04X}-U+{start + 127:04X}'